@@ -16,15 +16,14 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # Load environment variables from .env file
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (queue-based; see medical_transcription.logging_config)
+from medical_transcription.logging_config import configure
+configure()
 
 logger = logging.getLogger(__name__)
 
-def process_audio_file(audio_file_path, output_dir=None):
+def process_audio_file(audio_file_path, output_dir=None, transcriber=None,
+                       ner=None, summarizer=None, report_generator=None):
     """
     Process an audio file through the entire pipeline:
     1. Transcribe the audio
@@ -36,15 +35,23 @@ def process_audio_file(audio_file_path, output_dir=None):
     Args:
         audio_file_path (str): Path to the audio file
         output_dir (str, optional): Directory to save the output files
+        transcriber, ner, summarizer, report_generator: Optional pre-loaded
+            component instances. When omitted, the shared singletons from
+            medical_transcription.models are used, so repeated calls within
+            one interpreter reuse already-loaded weights.
     
     Returns:
         dict: Results of the processing pipeline
     """
     try:
-        from medical_transcription.transcription.whisper_transcriber import WhisperTranscriber
-        from medical_transcription.ner.medical_ner import MedicalNER
-        from medical_transcription.summarization.text_summarizer import TextSummarizer
-        from medical_transcription.report_generation.report_generator import ReportGenerator
+        from medical_transcription import models
+        
+        # Fall back to the shared singleton registry for any component
+        # that was not injected
+        transcriber = transcriber or models.get_transcriber()
+        ner = ner or models.get_ner()
+        summarizer = summarizer or models.get_summarizer()
+        report_generator = report_generator or models.get_report_generator()
         
         # Create output directory if it doesn't exist
         if output_dir:
@@ -54,7 +61,6 @@ def process_audio_file(audio_file_path, output_dir=None):
             
         # Step 1: Transcribe the audio
         logger.info(f"Transcribing audio file: {audio_file_path}")
-        transcriber = WhisperTranscriber()
         transcription = transcriber.transcribe(audio_file_path)
         
         # Save transcription to file
@@ -65,13 +71,11 @@ def process_audio_file(audio_file_path, output_dir=None):
         
         # Step 2: Extract medical entities
         logger.info("Extracting medical entities")
-        ner = MedicalNER()
         entities = ner.extract_medical_entities(transcription)
         formatted_entities = ner.format_entities_for_report(entities)
         
         # Step 3: Generate a summary
         logger.info("Generating summary")
-        summarizer = TextSummarizer()
         summary = summarizer.summarize_medical_conversation(transcription)
         
         # Save summary to file
@@ -82,7 +86,6 @@ def process_audio_file(audio_file_path, output_dir=None):
         
         # Step 4: Generate a clinical report
         logger.info("Generating clinical report")
-        report_generator = ReportGenerator()
         report = report_generator.generate_report(formatted_entities, summary)
         
         # Step 5: Save the report as PDF
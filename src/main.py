@@ -17,15 +17,9 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # Load environment variables from .env file
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("app.log")
-    ]
-)
+# Configure logging (queue-based; see medical_transcription.logging_config)
+from medical_transcription.logging_config import configure
+configure()
 
 logger = logging.getLogger(__name__)
 
@@ -39,13 +33,19 @@ def main():
         
         # Get port from environment variable or use default
         port = int(os.getenv("PORT", 8000))
-        
+
+        # Auto-reload is useful in development but incompatible with multiple
+        # workers; default to a bounded worker pool for production throughput.
+        reload = os.getenv("RELOAD", "false").lower() == "true"
+        workers = 1 if reload else int(os.getenv("WEB_WORKERS", max(2, (os.cpu_count() or 2) // 2)))
+
         # Run the application
         uvicorn.run(
             "medical_transcription.api.app:app",
             host="0.0.0.0",
             port=port,
-            reload=True
+            reload=reload,
+            workers=workers
         )
     except Exception as e:
         logger.error(f"Error starting application: {e}")
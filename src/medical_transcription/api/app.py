@@ -1,27 +1,28 @@
 import os
+import asyncio
+import hashlib
+import json
 import logging
 import tempfile
-import uuid
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Form
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Form, Request
 from fastapi.responses import JSONResponse, FileResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import uvicorn
+import aiofiles
 from datetime import datetime
 from dotenv import load_dotenv
 
 # Import our modules
-from ..transcription.whisper_transcriber import WhisperTranscriber
-from ..ner.medical_ner import MedicalNER
-from ..summarization.text_summarizer import TextSummarizer
-from ..knowledge_base.vector_store import MedicalKnowledgeBase
-from ..report_generation.report_generator import ReportGenerator
+from .. import models
+from .. import workers
+from ..logging_config import configure
+from ..report_generation.report_generator import is_error_message
+from .batcher import DynamicBatcher
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure()
 logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
@@ -31,31 +32,89 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Initialize components
-transcriber = WhisperTranscriber()
-ner = MedicalNER()
-summarizer = TextSummarizer()
-kb = MedicalKnowledgeBase()
-report_generator = ReportGenerator()
+# Bounded worker pool for CPU-heavy model calls. The endpoints are async, so
+# running model inference directly would block the event loop and cap the
+# server at one concurrent request; offloading to this pool lets the loop keep
+# serving uploads and downloads while inference runs.
+EXECUTOR = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+async def run_blocking(func, *args):
+    """
+    Run a blocking (CPU-heavy) callable in the shared worker pool without
+    blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(EXECUTOR, func, *args)
+
+def _report_cache_key(entities, summary):
+    """
+    Content hash identifying a report request. Identical (entities, summary)
+    payloads map to the same key, so retried or re-submitted requests reuse
+    the already-generated report and PDF.
+    """
+    payload = json.dumps({"e": entities, "s": summary}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+# Size of each chunk when streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1MB
+
+async def save_upload(file, destination_path):
+    """
+    Stream an uploaded file to disk in chunks. This caps memory at the chunk
+    size instead of holding the whole upload in RAM, and yields the event
+    loop between chunks.
+    """
+    async with aiofiles.open(destination_path, "wb") as f:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            await f.write(chunk)
+
+# Shared model components from the singleton registry
+transcriber = models.get_transcriber()
+ner = models.get_ner()
+summarizer = models.get_summarizer()
+kb = models.get_knowledge_base()
+report_generator = models.get_report_generator()
+
+def _summarize_batch(texts):
+    """Summarize a batch of texts in one padded generate call."""
+    return summarizer.summarize_medical_conversation_batch(texts)
+
+# Micro-batchers coalesce concurrent requests within a short window so one
+# model forward pass serves several callers
+ner_batcher = DynamicBatcher(ner.extract_medical_entities_batch, max_batch_size=16, max_wait_ms=10, executor=EXECUTOR)
+summarize_batcher = DynamicBatcher(_summarize_batch, max_batch_size=16, max_wait_ms=10, executor=EXECUTOR)
 
 # Ensure API key is loaded and report generator is initialized
 @app.on_event("startup")
 async def startup_event():
     # Load environment variables
     load_dotenv()
-    
+
     # Check for API key
     api_key = os.getenv("GOOGLE_API_KEY")
     logger.info(f"API key available at startup: {bool(api_key)}")
-    
+
     # Explicitly initialize report generator if needed
     if report_generator.model is None and api_key:
         logger.info("Explicitly initializing report generator at startup")
         report_generator.configure_api(api_key)
 
+    # Start the micro-batching workers
+    ner_batcher.start()
+    summarize_batcher.start()
+
+    # Warm the models in the worker pool so the first real request
+    # does not pay the full weight-load cost
+    await run_blocking(models.warmup)
+
 # Create a directory for storing temporary files
 os.makedirs("temp", exist_ok=True)
 
+# Keep temporary audio on tmpfs when available so uploads never touch the
+# SSD; an explicit TMPDIR still takes precedence
+if not os.getenv("TMPDIR") and os.path.isdir("/dev/shm"):
+    tempfile.tempdir = "/dev/shm"
+
 # Define request and response models
 class TranscriptionRequest(BaseModel):
     audio_url: Optional[str] = None
@@ -93,7 +152,8 @@ class FullProcessResponse(BaseModel):
     entities: List[Dict[str, Any]]
     summary: str
     report: str
-    report_url: str
+    report_url: Optional[str] = None
+    explanations: Optional[str] = None
 
 # API endpoints
 @app.get("/")
@@ -101,30 +161,26 @@ async def root():
     return {"message": "Welcome to the Medical Transcription Analysis Application"}
 
 @app.post("/transcribe", response_model=TranscriptionResponse)
-async def transcribe_audio(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+async def transcribe_audio(file: UploadFile = File(...)):
     """
     Transcribe an audio file to text.
     """
     try:
-        # Save uploaded file to a temporary location
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-        temp_file_path = temp_file.name
-        
-        # Write the file content
-        with open(temp_file_path, "wb") as f:
-            f.write(await file.read())
-        
-        # Transcribe the audio
-        start_time = datetime.now()
-        transcription = transcriber.transcribe(temp_file_path)
-        end_time = datetime.now()
+        # Spool the upload into a self-deleting temporary file and
+        # transcribe it while the file is still open — no cleanup task
+        # needed and no orphan files on crash
+        with tempfile.NamedTemporaryFile(suffix=".wav") as temp_file:
+            # Stream the file content to disk in chunks
+            await save_upload(file, temp_file.name)
+            
+            # Transcribe the audio
+            start_time = datetime.now()
+            transcription = await run_blocking(transcriber.transcribe, temp_file.name)
+            end_time = datetime.now()
         
         # Calculate duration
         duration_seconds = (end_time - start_time).total_seconds()
         
-        # Schedule cleanup of temporary file
-        background_tasks.add_task(os.unlink, temp_file_path)
-        
         return {
             "transcription": transcription,
             "duration_seconds": duration_seconds
@@ -139,7 +195,7 @@ async def extract_entities(request: EntityExtractionRequest):
     Extract medical entities from text.
     """
     try:
-        entities = ner.extract_medical_entities(request.text)
+        entities = await ner_batcher.submit(request.text)
         return {"entities": entities}
     except Exception as e:
         logger.error(f"Error during entity extraction: {str(e)}")
@@ -151,7 +207,7 @@ async def summarize_text(request: SummarizationRequest):
     Summarize medical text.
     """
     try:
-        summary = summarizer.summarize_medical_conversation(request.text)
+        summary = await summarize_batcher.submit(request.text)
         return {"summary": summary}
     except Exception as e:
         logger.error(f"Error during summarization: {str(e)}")
@@ -163,14 +219,33 @@ async def generate_report(request: ReportGenerationRequest):
     Generate a medical report from entities and summary.
     """
     try:
-        report = report_generator.generate_report(request.entities, request.summary)
-        
-        # Generate a unique filename for the report
-        report_id = str(uuid.uuid4())
+        # Reports are content-addressed: identical payloads (front-end
+        # retries, re-submissions) skip the LLM and PDF work entirely
+        report_id = _report_cache_key(request.entities, request.summary)
         report_filename = f"temp/report_{report_id}.pdf"
+        report_text_filename = f"temp/report_{report_id}.txt"
         
-        # Save the report as PDF
-        report_generator.save_report_as_pdf(report, report_filename)
+        if os.path.exists(report_filename) and os.path.exists(report_text_filename):
+            logger.info(f"Reusing cached report {report_id}")
+            async with aiofiles.open(report_text_filename, "r") as f:
+                report = await f.read()
+            return {
+                "report": report,
+                "report_url": f"/download_report/{report_id}"
+            }
+        
+        report = await run_blocking(report_generator.generate_report, request.entities, request.summary)
+        
+        # Never cache an error sentinel: the cache is content-addressed, so
+        # persisting it would pin the failure to this payload forever
+        if is_error_message(report):
+            logger.warning("Report generation failed; returning the error without caching")
+            return {"report": report, "report_url": None}
+        
+        # Save the report as PDF, plus the text alongside for cache hits
+        await run_blocking(report_generator.save_report_as_pdf, report, report_filename)
+        async with aiofiles.open(report_text_filename, "w") as f:
+            await f.write(report)
         
         return {
             "report": report,
@@ -181,15 +256,28 @@ async def generate_report(request: ReportGenerationRequest):
         raise HTTPException(status_code=500, detail=f"Report generation error: {str(e)}")
 
 @app.get("/download_report/{report_id}")
-async def download_report(report_id: str):
+async def download_report(report_id: str, request: Request):
     """
     Download a generated report.
+    
+    Serves the gzip-precompressed copy when the client accepts it, saving
+    both per-request compression CPU and ~40% of the bytes on the wire.
     """
     report_filename = f"temp/report_{report_id}.pdf"
     
     if not os.path.exists(report_filename):
         raise HTTPException(status_code=404, detail="Report not found")
     
+    accept_encoding = request.headers.get("accept-encoding", "")
+    compressed_filename = report_filename + ".gz"
+    if "gzip" in accept_encoding and os.path.exists(compressed_filename):
+        return FileResponse(
+            path=compressed_filename,
+            filename="clinical_report.pdf",
+            media_type="application/pdf",
+            headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+        )
+    
     return FileResponse(
         path=report_filename,
         filename="clinical_report.pdf",
@@ -216,49 +304,81 @@ async def process_full(background_tasks: BackgroundTasks,
         # Step 1: Get transcription (either from audio or directly provided)
         transcription = None
         if file:
-            # Save uploaded file to a temporary location
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-            temp_file_path = temp_file.name
-            
-            # Write the file content
-            with open(temp_file_path, "wb") as f:
-                f.write(await file.read())
-            
-            # Transcribe the audio
-            transcription = transcriber.transcribe(temp_file_path)
-            
-            # Schedule cleanup of temporary file
-            background_tasks.add_task(os.unlink, temp_file_path)
+            # Spool the upload into a self-deleting temporary file and
+            # transcribe it while the file is still open
+            with tempfile.NamedTemporaryFile(suffix=".wav") as temp_file:
+                # Stream the file content to disk in chunks
+                await save_upload(file, temp_file.name)
+                
+                # Transcribe the audio
+                transcription = await run_blocking(transcriber.transcribe, temp_file.name)
         elif text:
             transcription = text
         else:
             raise HTTPException(status_code=400, detail="Either audio file or text must be provided")
         
-        # Step 2: Extract entities
-        entities = ner.extract_medical_entities(transcription)
-        
-        # Step 3: Summarize
-        summary = summarizer.summarize_medical_conversation(transcription)
-        
-        # Step 4: Generate report
-        logger.info("About to generate report...")
-        report = report_generator.generate_report(entities, summary)
-        logger.info(f"Report generation result: {'Success' if not report.startswith('Error') else report}")
+        # Steps 2 and 3: extract entities and summarize concurrently —
+        # both depend only on the transcription, so the slower stage hides
+        # the faster one entirely
+        entities, summary = await asyncio.gather(
+            run_blocking(ner.extract_medical_entities, transcription),
+            run_blocking(summarizer.summarize_medical_conversation, transcription)
+        )
         
-        # Step 5: Save report as PDF
-        report_id = str(uuid.uuid4())
+        # Step 4: Generate report (reusing a cached identical report when present)
+        report_id = _report_cache_key(entities, summary)
         report_filename = f"temp/report_{report_id}.pdf"
-        report_generator.save_report_as_pdf(report, report_filename)
+        report_text_filename = f"temp/report_{report_id}.txt"
         
-        # Step 6: Create knowledge base (in background)
-        background_tasks.add_task(kb.create_index, transcription)
+        report_url = f"/download_report/{report_id}"
+        explanations = None
+        if os.path.exists(report_filename) and os.path.exists(report_text_filename):
+            logger.info(f"Reusing cached report {report_id}")
+            async with aiofiles.open(report_text_filename, "r") as f:
+                report = await f.read()
+        else:
+            logger.info("About to generate report...")
+            # The report and the glossary of detected terms are independent
+            # Gemini calls; issuing them together overlaps the round-trips
+            terms = ", ".join(dict.fromkeys(e["term"] for e in entities))
+            if terms:
+                report, explanations = await report_generator.generate_report_and_explanations(
+                    entities, summary, terms
+                )
+                if explanations is not None and is_error_message(explanations):
+                    explanations = None
+            else:
+                report = await run_blocking(report_generator.generate_report, entities, summary)
+            logger.info(f"Report generation result: {'Success' if not is_error_message(report) else report}")
+            
+            if is_error_message(report):
+                # Never cache an error sentinel: the cache is
+                # content-addressed, so persisting it would pin the
+                # failure to this payload forever
+                logger.warning("Report generation failed; skipping PDF and report cache")
+                report_url = None
+            else:
+                # Step 5: Save report as PDF (offloaded to the worker queue when available)
+                if workers.WORKERS_AVAILABLE:
+                    workers.render_pdf.send(report, report_filename)
+                else:
+                    await run_blocking(report_generator.save_report_as_pdf, report, report_filename)
+                async with aiofiles.open(report_text_filename, "w") as f:
+                    await f.write(report)
+        
+        # Step 6: Create knowledge base (worker queue, or in-process background task)
+        if workers.WORKERS_AVAILABLE:
+            workers.build_kb.send(transcription)
+        else:
+            background_tasks.add_task(kb.create_index, transcription)
         
         return {
             "transcription": transcription,
             "entities": entities,
             "summary": summary,
             "report": report,
-            "report_url": f"/download_report/{report_id}"
+            "report_url": report_url,
+            "explanations": explanations
         }
     except Exception as e:
         logger.error(f"Error during full processing: {str(e)}")
@@ -283,7 +403,7 @@ async def explain_terms(terms: str):
     Explain medical terms in simple language.
     """
     try:
-        explanations = report_generator.explain_medical_terms(terms)
+        explanations = await run_blocking(report_generator.explain_medical_terms, terms)
         return {"explanations": explanations}
     except Exception as e:
         logger.error(f"Error explaining medical terms: {str(e)}")
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class DynamicBatcher:
+    """
+    Coalesce concurrent requests into micro-batches for model inference.
+
+    Callers submit single items; a background worker drains the queue up to
+    ``max_batch_size`` items (waiting at most ``max_wait_ms`` for stragglers)
+    and invokes ``batch_fn`` once with the whole list. This amortizes model
+    forward-pass overhead across concurrent requests instead of paying it per
+    call.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=16, max_wait_ms=10, executor=None):
+        """
+        Args:
+            batch_fn (callable): Function taking a list of inputs and returning
+                a list of results of the same length and order.
+            max_batch_size (int): Maximum number of items per batch.
+            max_wait_ms (int): How long to wait for additional items after the
+                first one arrives, in milliseconds.
+            executor (concurrent.futures.Executor, optional): Pool to run
+                batch_fn in. Defaults to the event loop's default executor.
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.executor = executor
+        self._queue = None
+        self._worker_task = None
+
+    def start(self):
+        """
+        Start the background batching worker. Must be called from within a
+        running event loop (e.g. a FastAPI startup hook).
+        """
+        if self._worker_task is None:
+            self._queue = asyncio.Queue()
+            self._worker_task = asyncio.get_running_loop().create_task(self._worker())
+            logger.info(f"DynamicBatcher started (max_batch_size={self.max_batch_size}, max_wait_ms={self.max_wait_ms})")
+
+    async def stop(self):
+        """
+        Stop the background batching worker.
+        """
+        if self._worker_task is not None:
+            self._worker_task.cancel()
+            try:
+                await self._worker_task
+            except asyncio.CancelledError:
+                pass
+            self._worker_task = None
+
+    async def submit(self, item):
+        """
+        Submit one item for batched processing and await its result.
+
+        Args:
+            item: A single input for batch_fn.
+
+        Returns:
+            The corresponding result from batch_fn.
+        """
+        if self._worker_task is None:
+            # Batcher not started (e.g. direct script usage): process inline
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(self.executor, self.batch_fn, [item])
+            return results[0]
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Block until at least one item arrives
+            item, future = await self._queue.get()
+            batch = [(item, future)]
+
+            # Drain stragglers up to the batch limit or the wait deadline
+            deadline = loop.time() + self.max_wait_ms / 1000.0
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            items = [entry[0] for entry in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.batch_fn, items)
+                for (_, fut), result in zip(batch, results):
+                    if not fut.done():
+                        fut.set_result(result)
+            except Exception as e:
+                logger.error(f"Error processing batch of {len(items)}: {str(e)}")
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
@@ -1,79 +1,208 @@
+import hashlib
 import logging
 import os
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
 from langchain.vectorstores import FAISS
+from langchain.embeddings.base import Embeddings
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from ..logging_config import configure
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure()
 logger = logging.getLogger(__name__)
 
+# Precompiled sentence-boundary pattern shared by every split call
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+
+class OnnxMiniLMEmbeddings(Embeddings):
+    """
+    Sentence embeddings via an INT8 dynamically-quantized ONNX Runtime
+    session. Exports the model to ONNX once (cached on disk), quantizes the
+    weights to int8, and serves embed calls through the fused ORT kernels —
+    substantially faster than the fp32 PyTorch encoder on CPU with
+    negligible accuracy loss.
+    """
+
+    def __init__(self, model_name="sentence-transformers/all-MiniLM-L6-v2"):
+        """
+        Args:
+            model_name (str): Name of the sentence-transformers model to export.
+        """
+        from transformers import AutoTokenizer
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        self.model_name = model_name
+        cache_dir = os.path.join(
+            os.path.expanduser("~"), ".cache", "medical_transcription",
+            "onnx_embeddings", model_name.replace("/", "_")
+        )
+        quantized_path = os.path.join(cache_dir, "model_quantized.onnx")
+
+        if not os.path.exists(quantized_path):
+            logger.info(f"Exporting and quantizing embedding model to {cache_dir}")
+            model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+            model.save_pretrained(cache_dir)
+            quantizer = ORTQuantizer.from_pretrained(cache_dir)
+            quantizer.quantize(
+                save_dir=cache_dir,
+                quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False)
+            )
+
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            cache_dir, file_name="model_quantized.onnx"
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        logger.info(f"Loaded quantized ONNX embedding model from {cache_dir}")
+
+    def embed_documents(self, texts):
+        """
+        Embed a batch of texts in a single forward pass.
+
+        Args:
+            texts (list): List of texts to embed
+
+        Returns:
+            list: One embedding (list of floats) per text
+        """
+        inputs = self.tokenizer(
+            list(texts), padding=True, truncation=True, max_length=256,
+            return_tensors="pt"
+        )
+        outputs = self.model(**inputs)
+        hidden = outputs.last_hidden_state.numpy()
+
+        # Mean-pool over the attention mask, then L2-normalize
+        mask = inputs["attention_mask"].numpy()[:, :, np.newaxis].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        normalized = pooled / np.clip(norms, 1e-12, None)
+
+        return normalized.tolist()
+
+    def embed_query(self, text):
+        """
+        Embed a single query text.
+        """
+        return self.embed_documents([text])[0]
+
 class MedicalKnowledgeBase:
     """
     A class to handle the medical knowledge base using vector embeddings and FAISS.
     """
     
-    def __init__(self, embedding_model_name="sentence-transformers/all-MiniLM-L6-v2"):
+    # Embedding models are shared across instances (keyed by model name) and
+    # loaded under a lock so concurrent requests cannot trigger duplicate
+    # multi-hundred-MB weight loads
+    _embed_lock = threading.Lock()
+    _shared_embeddings = {}
+    
+    def __init__(self, embedding_model_name="sentence-transformers/all-MiniLM-L6-v2",
+                 chunk_size=200, chunk_overlap=50):
         """
         Initialize the MedicalKnowledgeBase with a specific embedding model.
         
         Args:
             embedding_model_name (str): Name of the embedding model to use.
+            chunk_size (int): Maximum size of text chunks, in characters.
+            chunk_overlap (int): Overlap carried between consecutive chunks.
         """
         logger.info(f"Initializing MedicalKnowledgeBase with embedding model: {embedding_model_name}")
         self.embedding_model_name = embedding_model_name
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
         self.embeddings = None
         self.faiss_index = None
         self.index_path = "faiss_index"
+        # In-memory LRU of loaded indices keyed by transcription hash, so
+        # re-processing the same text skips both embedding and deserialization
+        self._index_cache = OrderedDict()
+        self._index_cache_size = 8
     
     def load_embeddings(self):
         """
         Load the embedding model if not already loaded.
+        
+        Thread-safe: concurrent callers block on a class-level lock while one
+        of them loads, and all instances with the same model name share one
+        loaded copy of the weights.
         """
-        if self.embeddings is None:
-            logger.info(f"Loading embedding model: {self.embedding_model_name}")
-            try:
-                self.embeddings = HuggingFaceEmbeddings(model_name=self.embedding_model_name)
-                logger.info("Embedding model loaded successfully")
-            except Exception as e:
-                logger.error(f"Error loading embedding model: {str(e)}")
-                raise
+        if self.embeddings is not None:
+            return
+        
+        with self._embed_lock:
+            if self.embedding_model_name not in self._shared_embeddings:
+                logger.info(f"Loading embedding model: {self.embedding_model_name}")
+                try:
+                    self._shared_embeddings[self.embedding_model_name] = OnnxMiniLMEmbeddings(
+                        model_name=self.embedding_model_name
+                    )
+                    logger.info("Quantized ONNX embedding model loaded successfully")
+                except Exception as e:
+                    logger.warning(f"ONNX embedding backend unavailable ({str(e)}), falling back to HuggingFaceEmbeddings")
+                    try:
+                        self._shared_embeddings[self.embedding_model_name] = HuggingFaceEmbeddings(
+                            model_name=self.embedding_model_name
+                        )
+                        logger.info("Embedding model loaded successfully")
+                    except Exception as fallback_error:
+                        logger.error(f"Error loading embedding model: {str(fallback_error)}")
+                        raise
+            self.embeddings = self._shared_embeddings[self.embedding_model_name]
     
-    def create_index(self, text, chunk_size=200, chunk_overlap=50):
+    def create_index(self, text):
         """
         Create a FAISS index from the given text.
         
+        Chunking parameters are taken from the instance (see __init__).
+        
         Args:
             text (str): The text to index
-            chunk_size (int): Size of text chunks
-            chunk_overlap (int): Overlap between chunks
             
         Returns:
             bool: True if successful, False otherwise
         """
         try:
+            # Reuse a cached index when this exact text was already indexed
+            key = self._text_key(text)
+            if key in self._index_cache:
+                logger.info(f"Reusing in-memory FAISS index for key {key}")
+                self.faiss_index = self._index_cache[key]
+                self._index_cache.move_to_end(key)
+                return True
+            
+            save_path = os.path.join(self.index_path, key)
+            if os.path.exists(save_path):
+                logger.info(f"Reusing on-disk FAISS index for key {key}")
+                if self.load_index(save_path):
+                    self._cache_index(key, self.faiss_index)
+                    return True
+            
             # Load embeddings if not already loaded
             self.load_embeddings()
             
-            logger.info(f"Creating FAISS index with chunk size {chunk_size} and overlap {chunk_overlap}")
+            logger.info(f"Creating FAISS index with chunk size {self.chunk_size} and overlap {self.chunk_overlap}")
             
-            # Split text into chunks
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=chunk_size, 
-                chunk_overlap=chunk_overlap
-            )
-            chunks = text_splitter.split_text(text)
+            # Split text into chunks along sentence boundaries
+            chunks = self.split_text(text)
             
             logger.info(f"Split text into {len(chunks)} chunks")
             
             # Create FAISS index
             self.faiss_index = FAISS.from_texts(chunks, self.embeddings)
             
-            # Save index
-            self.save_index()
+            # For large corpora, swap the flat index for a trained IVFPQ one
+            self._optimize_index(len(chunks))
+            
+            # Save index under its content hash, then move the search copy
+            # to GPU (a GPU-resident index cannot be serialized)
+            self.save_index(save_path)
+            self._index_to_gpu()
+            self._cache_index(key, self.faiss_index)
             
             logger.info("FAISS index created and saved successfully")
             return True
@@ -81,6 +210,128 @@ class MedicalKnowledgeBase:
             logger.error(f"Error creating FAISS index: {str(e)}")
             return False
     
+    def split_text(self, text):
+        """
+        Split text into chunks of at most chunk_size characters along
+        sentence boundaries, carrying chunk_overlap characters of trailing
+        sentences into the next chunk.
+        
+        Uses one precompiled regex pass over the text instead of the
+        separator-retry loop in RecursiveCharacterTextSplitter.
+        
+        Args:
+            text (str): The text to split
+            
+        Returns:
+            list: List of text chunks
+        """
+        sentences = [s for s in _SENTENCE_RE.split(text) if s.strip()]
+        
+        chunks = []
+        current = []
+        current_len = 0
+        for sentence in sentences:
+            # Hard-split sentences that alone exceed the chunk size
+            while len(sentence) > self.chunk_size:
+                if current:
+                    chunks.append(" ".join(current))
+                    current, current_len = [], 0
+                chunks.append(sentence[:self.chunk_size])
+                sentence = sentence[self.chunk_size - self.chunk_overlap:]
+            
+            if current_len + len(sentence) + 1 > self.chunk_size and current:
+                chunks.append(" ".join(current))
+                # Carry trailing sentences up to chunk_overlap characters
+                overlap, overlap_len = [], 0
+                for prev in reversed(current):
+                    if overlap_len + len(prev) > self.chunk_overlap:
+                        break
+                    overlap.insert(0, prev)
+                    overlap_len += len(prev) + 1
+                current, current_len = overlap, overlap_len
+            
+            current.append(sentence)
+            current_len += len(sentence) + 1
+        
+        if current:
+            chunks.append(" ".join(current))
+        
+        return chunks
+    
+    # Below this many chunks a flat index is already fast, and — more
+    # importantly — each 8-bit PQ sub-quantizer trains 256 centroids, so
+    # k-means needs several thousand vectors before the codebooks are
+    # meaningfully trained; switching earlier trades recall for nothing
+    IVFPQ_MIN_CHUNKS = 8192
+    
+    def _optimize_index(self, num_chunks):
+        """
+        Rebuild the default flat L2 index as an IVFPQ index for large corpora,
+        and move it to GPU when one is available.
+        
+        A flat index scans every vector per query (O(N x d)); IVFPQ probes a
+        handful of clusters over compressed codes, which is both faster and
+        roughly 8x smaller in memory. Small corpora keep the exact flat index.
+        
+        Args:
+            num_chunks (int): Number of chunks in the index
+        """
+        if num_chunks < self.IVFPQ_MIN_CHUNKS:
+            return
+        
+        try:
+            import faiss
+            
+            flat_index = self.faiss_index.index
+            d = flat_index.d
+            embeddings = flat_index.reconstruct_n(0, flat_index.ntotal)
+            
+            nlist = min(100, max(1, num_chunks // 4))
+            quantizer = faiss.IndexFlatL2(d)
+            ivfpq = faiss.IndexIVFPQ(quantizer, d, nlist, 16, 8)
+            ivfpq.train(embeddings)
+            ivfpq.add(embeddings)
+            ivfpq.nprobe = 8
+            
+            self.faiss_index.index = ivfpq
+            logger.info(f"Rebuilt flat index as IVFPQ (nlist={nlist}, nprobe=8) for {num_chunks} chunks")
+        except Exception as e:
+            logger.warning(f"Could not rebuild index as IVFPQ, keeping flat index: {str(e)}")
+    
+    def _index_to_gpu(self):
+        """
+        Move the current FAISS index to GPU when one is available. Must be
+        called after the index has been saved, as GPU indices cannot be
+        serialized.
+        """
+        try:
+            import faiss
+            import torch
+            if torch.cuda.is_available():
+                resources = faiss.StandardGpuResources()
+                self.faiss_index.index = faiss.index_cpu_to_gpu(resources, 0, self.faiss_index.index)
+                logger.info("FAISS index transferred to GPU")
+        except Exception as gpu_error:
+            logger.info(f"Keeping FAISS index on CPU: {str(gpu_error)}")
+    
+    @staticmethod
+    def _text_key(text):
+        """
+        Deterministic cache key for a piece of text.
+        """
+        return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+    
+    def _cache_index(self, key, index):
+        """
+        Insert an index into the in-memory LRU cache, evicting the oldest
+        entry when the cache is full.
+        """
+        self._index_cache[key] = index
+        self._index_cache.move_to_end(key)
+        while len(self._index_cache) > self._index_cache_size:
+            evicted_key, _ = self._index_cache.popitem(last=False)
+            logger.info(f"Evicted FAISS index {evicted_key} from in-memory cache")
+    
     def save_index(self, path=None):
         """
         Save the FAISS index to disk.
@@ -118,6 +369,16 @@ class MedicalKnowledgeBase:
         """
         load_path = path or self.index_path
         
+        # The default index path holds one subdirectory per transcription
+        # hash; when no explicit path is given, fall back to the most
+        # recently written index
+        if path is None and os.path.isdir(load_path) and not os.path.exists(os.path.join(load_path, "index.faiss")):
+            subdirs = [os.path.join(load_path, d) for d in os.listdir(load_path)]
+            subdirs = [d for d in subdirs if os.path.isdir(d)]
+            if subdirs:
+                load_path = max(subdirs, key=os.path.getmtime)
+                logger.info(f"Using most recent FAISS index at {load_path}")
+        
         if not os.path.exists(load_path):
             logger.error(f"FAISS index not found at {load_path}")
             return False
@@ -0,0 +1,55 @@
+"""
+Central logging configuration for the application.
+
+Every module used to call ``logging.basicConfig`` at import time, and
+``main.py`` attached a blocking FileHandler that performs file I/O on the
+request path for every record. ``configure()`` sets up the root logger once:
+hot paths enqueue records onto an in-memory queue (non-blocking), and a
+QueueListener thread drains them to the console and a rotating log file.
+"""
+
+import logging
+import logging.handlers
+import queue
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_configured = False
+_listener = None
+
+
+def configure(level=logging.INFO, log_file="app.log"):
+    """
+    Configure root logging for the whole application. Idempotent: only the
+    first call has any effect, so modules can call this at import time.
+
+    Args:
+        level (int): Root log level.
+        log_file (str): Path of the rotating log file.
+    """
+    global _configured, _listener
+    if _configured:
+        return
+
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=10 << 20, backupCount=3
+    )
+    file_handler.setFormatter(formatter)
+
+    # Producers enqueue; the listener thread does the actual (blocking) I/O
+    log_queue = queue.Queue(-1)
+    _listener = logging.handlers.QueueListener(
+        log_queue, stream_handler, file_handler, respect_handler_level=True
+    )
+    _listener.start()
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _configured = True
@@ -0,0 +1,80 @@
+"""
+Module-level registry of the heavyweight model components.
+
+Each getter is cached with ``functools.lru_cache`` so every caller — the API
+process, the example scripts, repeated invocations within one interpreter —
+shares a single instance instead of reloading multi-hundred-MB weights from
+disk per use. ``warmup()`` forces the lazy model loads up front so the first
+real request does not pay the load cost.
+"""
+
+import logging
+from functools import lru_cache
+
+from .transcription.whisper_transcriber import WhisperTranscriber
+from .ner.medical_ner import MedicalNER
+from .summarization.text_summarizer import TextSummarizer
+from .knowledge_base.vector_store import MedicalKnowledgeBase
+from .report_generation.report_generator import ReportGenerator
+
+logger = logging.getLogger(__name__)
+
+# Short text used to exercise the NLP models during warmup
+_WARMUP_TEXT = "The patient reports a mild headache."
+
+
+@lru_cache(maxsize=1)
+def get_transcriber():
+    """Return the shared WhisperTranscriber instance."""
+    return WhisperTranscriber()
+
+
+@lru_cache(maxsize=1)
+def get_ner():
+    """Return the shared MedicalNER instance."""
+    return MedicalNER()
+
+
+@lru_cache(maxsize=1)
+def get_summarizer():
+    """Return the shared TextSummarizer instance."""
+    return TextSummarizer()
+
+
+@lru_cache(maxsize=1)
+def get_knowledge_base():
+    """Return the shared MedicalKnowledgeBase instance."""
+    return MedicalKnowledgeBase()
+
+
+@lru_cache(maxsize=1)
+def get_report_generator():
+    """Return the shared ReportGenerator instance."""
+    return ReportGenerator()
+
+
+def warmup():
+    """
+    Load model weights and run a tiny inference through each NLP model so the
+    first real request does not pay for lazy loading or kernel autotuning.
+    Failures are logged but not raised — a model that cannot warm up will
+    surface its error on first use instead.
+    """
+    logger.info("Warming up model components")
+    try:
+        get_transcriber().load_model()
+    except Exception as e:
+        logger.warning(f"Transcriber warmup failed: {e}")
+    try:
+        get_ner().extract_medical_entities(_WARMUP_TEXT)
+    except Exception as e:
+        logger.warning(f"NER warmup failed: {e}")
+    try:
+        get_summarizer().summarize_medical_conversation(_WARMUP_TEXT)
+    except Exception as e:
+        logger.warning(f"Summarizer warmup failed: {e}")
+    try:
+        get_knowledge_base().load_embeddings()
+    except Exception as e:
+        logger.warning(f"Knowledge base warmup failed: {e}")
+    logger.info("Model warmup complete")
@@ -1,4 +1,9 @@
+import asyncio
+import gzip
 import logging
+import re
+import random
+import shutil
 import time
 import os
 import google.generativeai as genai
@@ -9,16 +14,107 @@ from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from dotenv import load_dotenv
 
+from ..logging_config import configure
+
 # Load environment variables
 load_dotenv()
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure()
 logger = logging.getLogger(__name__)
 
+# Quota and availability errors are worth retrying; malformed requests and
+# auth failures will fail identically every time, so retrying them only
+# burns the user's wall time
+try:
+    from google.api_core import exceptions as api_exceptions
+    PERMANENT_ERRORS = (
+        api_exceptions.InvalidArgument,
+        api_exceptions.PermissionDenied,
+    )
+except ImportError:
+    PERMANENT_ERRORS = ()
+
+
+def is_error_message(text):
+    """
+    True when a generation method returned one of its error sentinels
+    ("Error: ..." / "Service is temporarily unavailable ...") instead of
+    model output. Callers that cache or persist reports must check this
+    so a transient failure is never stored as the report for a payload.
+    
+    Args:
+        text (str): A string returned by a generation method
+        
+    Returns:
+        bool: Whether the string is an error sentinel
+    """
+    return text.startswith("Error:") or text.startswith("Service is temporarily unavailable")
+
+
+def _backoff_delay(delay, attempt):
+    """Exponential backoff with jitter to avoid synchronized retry storms."""
+    return delay * (2 ** attempt) + random.uniform(0, 0.5)
+
+
+# Classifies a markdown-ish report line in one scan: group(1) is the run of
+# leading '#' characters, group(2) the remaining text
+_HEADER_RE = re.compile(r'^(#{1,3})\s*(.*)$')
+
+# Prompt templates are parsed once at import; call sites only pay for the
+# .format substitution instead of rebuilding ~1KB literals per request
+_REPORT_PROMPT_TMPL = """
+        You are an expert medical assistant tasked with generating a detailed and structured clinical report. Based on the extracted medical entities and summarized findings from a doctor-patient conversation, provide a well-formatted report. Follow this structure:
+        
+        ### **Patient Clinical Report**  
+        **Patient Information:**  
+        - Name: [If available]  
+        - Age: [If available]  
+        - Gender: [If available]  
+        - Date of Visit: [Today's Date]  
+        - Physician: [If available]  
+        
+        ### **Chief Complaint & History:**  
+        - **Primary Symptoms:** {entities_text}  
+        - **Medical History:** [Include relevant history if mentioned]  
+        - **Medications:** [Any current medications]  
+        - **Allergies:** [List allergies if specified]  
+        
+        ### **Examination Findings & Observations:**  
+        - **Vital Signs:** [If available, include BP, HR, Temperature, etc.]  
+        - **Physical Examination Findings:** [Summarized key observations]  
+        - **Lab & Imaging Results:** [If applicable, summarize any relevant findings]  
+        
+        ### **Assessment & Diagnosis:**  
+        - **Provisional Diagnosis:** [Provide likely diagnosis based on the data]  
+        - **Differential Diagnosis:** [Mention other possible conditions]  
+        - **Clinical Justification:** {summary}  
+        
+        ### **Treatment Plan & Recommendations:**  
+        - **Medications Prescribed:** [List medicines with dosage]  
+        - **Diagnostic Tests Advised:** [Any further tests recommended]  
+        - **Lifestyle & Dietary Recommendations:** [If applicable]  
+        - **Follow-up Instructions:** [Next steps and monitoring plan]  
+        
+        ### **Additional Notes & Explanations:**  
+        - Provide **simple explanations** for complex medical terms in the report.  
+        """
+
+_EXPLANATION_PROMPT_TMPL = """
+        Explain the following medical terms in a simple and easy-to-understand way: "{text}".
+        
+        **Requirements:**
+        - Provide a concise yet informative definition.
+        - Explain in layman's terms (avoid medical jargon).
+        - If applicable, include causes, symptoms, and common treatments.
+        - If multiple terms exist, list explanations separately.
+        - Keep it structured and formatted properly.
+
+        Example:
+        **Term:** Hypertension  
+        **Explanation:** Hypertension (high blood pressure) occurs when the force of blood against artery walls is too high. It can be caused by stress, poor diet, or genetics. It increases the risk of heart disease and stroke. Treatments include lifestyle changes and medication.
+        """
+
 class ReportGenerator:
     """
     A class to handle medical report generation using Google's Gemini model.
@@ -64,58 +160,129 @@ class ReportGenerator:
     def generate_report(self, entities, summary, retries=3, delay=5):
         """
         Generate a clinical report based on entities and summary.
-        
+
+        Blocks until the full report is available; used by the PDF and
+        caching paths. Nothing reaches the caller until the response is
+        complete, so every failure — including one mid-response — is
+        retried here rather than returning a truncated report. Interactive
+        callers should prefer generate_report_stream so tokens can be
+        rendered as Gemini produces them.
+
         Args:
             entities (str or list): Extracted medical entities
             summary (str): Summarized medical conversation
             retries (int): Number of retries if generation fails
             delay (int): Delay between retries in seconds
-            
+
         Returns:
             str: Generated clinical report
         """
-        # Format entities if they're in list form
-        if isinstance(entities, list):
-            entities_text = ", ".join([f"{e['term']} ({e['type']})" for e in entities])
-        else:
-            entities_text = str(entities)
+        prompt = self._build_report_prompt(entities, summary)
+
+        if self.model is None:
+            logger.error("Gemini model not initialized. Check API key.")
+            return "Error: Gemini model not initialized. Check API key."
+
+        for i in range(retries):
+            try:
+                logger.info("Generating clinical report with Gemini")
+                response = self.model.generate_content(prompt)
+                logger.info("Report generation complete")
+                return response.text
+            except Exception as e:
+                if isinstance(e, PERMANENT_ERRORS):
+                    logger.error(f"Non-retryable error generating report ({type(e).__name__}): {e}")
+                    break
+                wait = _backoff_delay(delay, i)
+                logger.error(f"Error generating report ({type(e).__name__}): {e}. Retrying in {wait:.1f} seconds...")
+                time.sleep(wait)
+
+        return "Service is temporarily unavailable. Please try again later."
+    
+    def generate_report_stream(self, entities, summary, retries=3, delay=5):
+        """
+        Generate a clinical report, yielding text chunks as Gemini streams
+        them. Total generation time is unchanged, but consumers can start
+        rendering after the first chunk instead of waiting for the full
+        response.
         
-        prompt = f"""
-        You are an expert medical assistant tasked with generating a detailed and structured clinical report. Based on the extracted medical entities and summarized findings from a doctor-patient conversation, provide a well-formatted report. Follow this structure:
+        Args:
+            entities (str or list): Extracted medical entities
+            summary (str): Summarized medical conversation
+            retries (int): Number of retries if generation fails
+            delay (int): Delay between retries in seconds
+            
+        Yields:
+            str: Chunks of the generated clinical report
+        """
+        prompt = self._build_report_prompt(entities, summary)
         
-        ### **Patient Clinical Report**  
-        **Patient Information:**  
-        - Name: [If available]  
-        - Age: [If available]  
-        - Gender: [If available]  
-        - Date of Visit: [Today's Date]  
-        - Physician: [If available]  
+        if self.model is None:
+            logger.error("Gemini model not initialized. Check API key.")
+            yield "Error: Gemini model not initialized. Check API key."
+            return
         
-        ### **Chief Complaint & History:**  
-        - **Primary Symptoms:** {entities_text}  
-        - **Medical History:** [Include relevant history if mentioned]  
-        - **Medications:** [Any current medications]  
-        - **Allergies:** [List allergies if specified]  
+        for i in range(retries):
+            yielded = False
+            try:
+                logger.info("Generating clinical report with Gemini (streaming)")
+                response = self.model.generate_content(prompt, stream=True)
+                for chunk in response:
+                    if chunk.text:
+                        yielded = True
+                        yield chunk.text
+                logger.info("Report generation complete")
+                return
+            except Exception as e:
+                if yielded:
+                    # Part of the report already reached the consumer;
+                    # retrying would duplicate it
+                    logger.error(f"Streaming failed mid-response ({type(e).__name__}): {e}")
+                    return
+                if isinstance(e, PERMANENT_ERRORS):
+                    logger.error(f"Non-retryable error generating report ({type(e).__name__}): {e}")
+                    break
+                wait = _backoff_delay(delay, i)
+                logger.error(f"Error generating report ({type(e).__name__}): {e}. Retrying in {wait:.1f} seconds...")
+                time.sleep(wait)
         
-        ### **Examination Findings & Observations:**  
-        - **Vital Signs:** [If available, include BP, HR, Temperature, etc.]  
-        - **Physical Examination Findings:** [Summarized key observations]  
-        - **Lab & Imaging Results:** [If applicable, summarize any relevant findings]  
+        yield "Service is temporarily unavailable. Please try again later."
+    
+    def _build_report_prompt(self, entities, summary):
+        """
+        Build the clinical report prompt from entities and summary.
         
-        ### **Assessment & Diagnosis:**  
-        - **Provisional Diagnosis:** [Provide likely diagnosis based on the data]  
-        - **Differential Diagnosis:** [Mention other possible conditions]  
-        - **Clinical Justification:** {summary}  
+        Args:
+            entities (str or list): Extracted medical entities
+            summary (str): Summarized medical conversation
+            
+        Returns:
+            str: Prompt for the Gemini model
+        """
+        # Format entities if they're in list form, deduplicating first so
+        # the prompt doesn't spend tokens repeating the same symptom, and
+        # streaming the strings straight into join
+        if isinstance(entities, list):
+            unique = dict.fromkeys((e['term'], e['type']) for e in entities)
+            entities_text = ", ".join(f"{term} ({etype})" for term, etype in unique)
+        else:
+            entities_text = str(entities)
         
-        ### **Treatment Plan & Recommendations:**  
-        - **Medications Prescribed:** [List medicines with dosage]  
-        - **Diagnostic Tests Advised:** [Any further tests recommended]  
-        - **Lifestyle & Dietary Recommendations:** [If applicable]  
-        - **Follow-up Instructions:** [Next steps and monitoring plan]  
+        return _REPORT_PROMPT_TMPL.format(entities_text=entities_text, summary=summary)
+    
+    def explain_medical_terms(self, text, retries=3, delay=5):
+        """
+        Explain medical terms in simple language.
         
-        ### **Additional Notes & Explanations:**  
-        - Provide **simple explanations** for complex medical terms in the report.  
+        Args:
+            text (str): Text containing medical terms to explain
+            retries (int): Number of retries if generation fails
+            delay (int): Delay between retries in seconds
+            
+        Returns:
+            str: Explanations of medical terms
         """
+        prompt = self._build_explanation_prompt(text)
         
         for i in range(retries):
             try:
@@ -123,61 +290,97 @@ class ReportGenerator:
                     logger.error("Gemini model not initialized. Check API key.")
                     return "Error: Gemini model not initialized. Check API key."
                 
-                logger.info("Generating clinical report with Gemini")
+                logger.info("Generating medical term explanations with Gemini")
                 response = self.model.generate_content(prompt)
-                logger.info("Report generation complete")
+                logger.info("Explanation generation complete")
                 
-                return response.text  # Extract the generated text
+                return response.text
             except Exception as e:
-                logger.error(f"Error generating report: {e}. Retrying in {delay} seconds...")
-                time.sleep(delay)
+                if isinstance(e, PERMANENT_ERRORS):
+                    logger.error(f"Non-retryable error generating explanations ({type(e).__name__}): {e}")
+                    break
+                wait = _backoff_delay(delay, i)
+                logger.error(f"Error generating explanations ({type(e).__name__}): {e}. Retrying in {wait:.1f} seconds...")
+                time.sleep(wait)
         
         return "Service is temporarily unavailable. Please try again later."
     
-    def explain_medical_terms(self, text, retries=3, delay=5):
+    def _build_explanation_prompt(self, text):
         """
-        Explain medical terms in simple language.
+        Build the medical term explanation prompt.
         
         Args:
             text (str): Text containing medical terms to explain
-            retries (int): Number of retries if generation fails
-            delay (int): Delay between retries in seconds
             
         Returns:
-            str: Explanations of medical terms
+            str: Prompt for the Gemini model
         """
-        prompt = f"""
-        Explain the following medical terms in a simple and easy-to-understand way: "{text}".
+        return _EXPLANATION_PROMPT_TMPL.format(text=text)
+    
+    async def _generate_async(self, prompt, description, retries=3, delay=5):
+        """
+        Run one Gemini request asynchronously with the same retry behavior
+        as the synchronous methods.
         
-        **Requirements:**
-        - Provide a concise yet informative definition.
-        - Explain in layman's terms (avoid medical jargon).
-        - If applicable, include causes, symptoms, and common treatments.
-        - If multiple terms exist, list explanations separately.
-        - Keep it structured and formatted properly.
-
-        Example:
-        **Term:** Hypertension  
-        **Explanation:** Hypertension (high blood pressure) occurs when the force of blood against artery walls is too high. It can be caused by stress, poor diet, or genetics. It increases the risk of heart disease and stroke. Treatments include lifestyle changes and medication.
+        Args:
+            prompt (str): Prompt to send to the model
+            description (str): Short label for log messages
+            retries (int): Number of retries if generation fails
+            delay (int): Delay between retries in seconds
+            
+        Returns:
+            str: Generated text
         """
+        if self.model is None:
+            logger.error("Gemini model not initialized. Check API key.")
+            return "Error: Gemini model not initialized. Check API key."
         
         for i in range(retries):
             try:
-                if self.model is None:
-                    logger.error("Gemini model not initialized. Check API key.")
-                    return "Error: Gemini model not initialized. Check API key."
-                
-                logger.info("Generating medical term explanations with Gemini")
-                response = self.model.generate_content(prompt)
-                logger.info("Explanation generation complete")
-                
+                logger.info(f"Generating {description} with Gemini (async)")
+                response = await self.model.generate_content_async(prompt)
+                logger.info(f"{description.capitalize()} generation complete")
                 return response.text
             except Exception as e:
-                logger.error(f"Error generating explanations: {e}. Retrying in {delay} seconds...")
-                time.sleep(delay)
+                if isinstance(e, PERMANENT_ERRORS):
+                    logger.error(f"Non-retryable error generating {description} ({type(e).__name__}): {e}")
+                    break
+                wait = _backoff_delay(delay, i)
+                logger.error(f"Error generating {description} ({type(e).__name__}): {e}. Retrying in {wait:.1f} seconds...")
+                await asyncio.sleep(wait)
         
         return "Service is temporarily unavailable. Please try again later."
     
+    async def generate_report_and_explanations(self, entities, summary, terms, retries=3, delay=5):
+        """
+        Generate the clinical report and the term explanations concurrently.
+        
+        The two Gemini calls are independent, so issuing them with
+        asyncio.gather overlaps the network round-trips instead of paying
+        for them back to back.
+        
+        Args:
+            entities (str or list): Extracted medical entities
+            summary (str): Summarized medical conversation
+            terms (str): Medical terms to explain
+            retries (int): Number of retries if generation fails
+            delay (int): Delay between retries in seconds
+            
+        Returns:
+            tuple: (report text, explanations text)
+        """
+        report, explanations = await asyncio.gather(
+            self._generate_async(
+                self._build_report_prompt(entities, summary),
+                "clinical report", retries, delay
+            ),
+            self._generate_async(
+                self._build_explanation_prompt(terms),
+                "medical term explanations", retries, delay
+            )
+        )
+        return report, explanations
+    
     def save_report_as_pdf(self, report_text, filename="clinical_report.pdf"):
         """
         Save the generated report as a PDF file.
@@ -194,23 +397,42 @@ class ReportGenerator:
             styles = getSampleStyleSheet()
             elements = []
             
+            # Hoist style lookups out of the loop and reuse one Spacer
+            # instance (reportlab does not mutate it during build)
+            heading1 = styles['Heading1']
+            heading2 = styles['Heading2']
+            normal = styles['Normal']
+            line_spacer = Spacer(1, 6)
+            
             elements.append(Paragraph("<b>Patient Clinical Report</b>", styles['Title']))
             elements.append(Spacer(1, 12))
             
-            for line in report_text.split("\n"):
+            for line in report_text.splitlines():
                 if line.strip():  # Skip empty lines
                     # Check if line is a header
-                    if line.startswith("###"):
-                        elements.append(Paragraph(line.replace("###", ""), styles['Heading1']))
+                    header = _HEADER_RE.match(line)
+                    if header:
+                        style = heading1 if len(header.group(1)) >= 3 else heading2
+                        elements.append(Paragraph(header.group(2), style))
                     elif line.startswith("**") and line.endswith("**"):
-                        elements.append(Paragraph(line, styles['Heading2']))
+                        elements.append(Paragraph(line, heading2))
                     else:
-                        elements.append(Paragraph(line, styles['Normal']))
+                        elements.append(Paragraph(line, normal))
                     
-                    elements.append(Spacer(1, 6))
+                    elements.append(line_spacer)
             
             doc.build(elements)
             logger.info(f"Report saved as {filename}")
+            
+            # Write a gzip sidecar so the API can serve a precompressed copy
+            # to clients that accept it (PDFs compress ~40%)
+            try:
+                with open(filename, "rb") as pdf_file:
+                    with gzip.open(filename + ".gz", "wb", compresslevel=3) as gz_file:
+                        shutil.copyfileobj(pdf_file, gz_file)
+            except Exception as gz_error:
+                logger.warning(f"Could not precompress report: {str(gz_error)}")
+            
             return True
         except Exception as e:
             logger.error(f"Error saving report as PDF: {str(e)}")
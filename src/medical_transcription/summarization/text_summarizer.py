@@ -1,19 +1,158 @@
 import logging
-import torch
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+import os
+from functools import lru_cache
+
+from ..logging_config import configure
+
+# torch and transformers are imported lazily inside the loaders — pulling
+# them in at module import costs seconds of startup even for callers that
+# only need the class definition
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure()
 logger = logging.getLogger(__name__)
 
+# The three ONNX graphs a seq2seq export produces; each is quantized
+# separately
+_ONNX_SEQ2SEQ_FILES = (
+    "encoder_model.onnx",
+    "decoder_model.onnx",
+    "decoder_with_past_model.onnx",
+)
+
+def _load_onnx_model(model_name):
+    """
+    Build an int8 ONNX Runtime seq2seq model for summarization. The model
+    is exported once and cached on disk; autoregressive decode is
+    memory-bandwidth bound, so int8 weights (~4x less bandwidth) plus
+    ORT's fused kernels cut CPU latency substantially.
+    
+    Args:
+        model_name (str): Name of the pre-trained model to export
+        
+    Returns:
+        tuple: (ORTModelForSeq2SeqLM, tokenizer)
+    """
+    from transformers import AutoTokenizer
+    import onnxruntime as ort
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    
+    cache_dir = os.path.join(
+        os.path.expanduser("~"), ".cache", "medical_summarizer",
+        model_name.replace("/", "_")
+    )
+    quantized_encoder = os.path.join(cache_dir, "encoder_model_quantized.onnx")
+    
+    if not os.path.exists(quantized_encoder):
+        logger.info(f"Exporting and quantizing summarization model to {cache_dir}")
+        model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True)
+        model.save_pretrained(cache_dir)
+        qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False)
+        for onnx_file in _ONNX_SEQ2SEQ_FILES:
+            quantizer = ORTQuantizer.from_pretrained(cache_dir, file_name=onnx_file)
+            quantizer.quantize(save_dir=cache_dir, quantization_config=qconfig)
+    
+    sess_options = ort.SessionOptions()
+    sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    sess_options.intra_op_num_threads = os.cpu_count()
+    
+    model = ORTModelForSeq2SeqLM.from_pretrained(
+        cache_dir,
+        encoder_file_name="encoder_model_quantized.onnx",
+        decoder_file_name="decoder_model_quantized.onnx",
+        decoder_with_past_file_name="decoder_with_past_model_quantized.onnx",
+        provider="CPUExecutionProvider",
+        session_options=sess_options
+    )
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    return model, tokenizer
+
+@lru_cache(maxsize=4)
+def _get_model(model_name):
+    """
+    Load a summarization model and tokenizer once per model id and share
+    them across all TextSummarizer instances, so per-request instantiation
+    never repeats the multi-GB deserialization.
+    
+    Args:
+        model_name (str): Name of the pre-trained model to load
+        
+    Returns:
+        tuple: (model, tokenizer)
+    """
+    import torch
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+    # The int8 ONNX backend is a CPU optimization — on a CUDA machine the
+    # fp16 SDPA path below is the fast one, so ONNX is only tried when no
+    # GPU is present (mirroring the NER pipeline loader)
+    if not torch.cuda.is_available():
+        try:
+            model, tokenizer = _load_onnx_model(model_name)
+            logger.info("Summarization model loaded via ONNX Runtime (int8)")
+            return model, tokenizer
+        except Exception as onnx_error:
+            logger.warning(f"ONNX Runtime backend unavailable ({str(onnx_error)}), using PyTorch model")
+
+    try:
+        # SDPA runs attention as a fused, tiled kernel instead of
+        # materializing the full attention matrix — a large win for the
+        # 1024-token encoder pass
+        model = AutoModelForSeq2SeqLM.from_pretrained(
+            model_name,
+            attn_implementation="sdpa",
+            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32
+        )
+        logger.info("Summarization model loaded with SDPA attention")
+    except (TypeError, ValueError) as sdpa_error:
+        logger.warning(f"SDPA attention unavailable ({str(sdpa_error)}), using default attention")
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+        try:
+            # On transformers versions without native SDPA support,
+            # BetterTransformer swaps in PyTorch's fused multi-head
+            # attention (with nested tensors that skip pad positions)
+            from optimum.bettertransformer import BetterTransformer
+            model = BetterTransformer.transform(model, keep_original_model=False)
+            logger.info("Applied BetterTransformer fused attention")
+        except Exception as bt_error:
+            logger.warning(f"BetterTransformer unavailable ({str(bt_error)}), keeping eager attention")
+    model = model.eval()
+    if torch.cuda.is_available():
+        # fp16 weights on GPU halve bandwidth per decoded token and run
+        # the matmuls on tensor cores
+        model = model.to("cuda")
+        logger.info("Summarization model moved to GPU (fp16)")
+    if os.getenv("SUMMARIZER_COMPILE", "true").lower() == "true":
+        try:
+            # The per-token decoder path is kernel-launch bound; Inductor
+            # fuses the layer-norm/GELU/residual chains and cuts dispatch
+            # overhead per step. Compile the forward rather than wrapping
+            # the module: generate() on a compiled module delegates back to
+            # the original eager forward, so the graph would never run.
+            # First generate pays the compile cost, and the module-level
+            # cache keeps the compiled model alive.
+            model.forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=False)
+            logger.info("Compiled summarization model forward with torch.compile (mode=reduce-overhead)")
+        except Exception as compile_error:
+            logger.warning(f"torch.compile unavailable for summarizer, using eager mode: {str(compile_error)}")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    return model, tokenizer
+
 class TextSummarizer:
     """
     A class to handle text summarization using pre-trained models.
     """
     
+    # BART's encoder window, and the stride between summarization windows
+    # for long transcripts (128 tokens of overlap keeps context across cuts)
+    MAX_INPUT_TOKENS = 1024
+    WINDOW_STRIDE = 896
+    
+    # Instruction prepended to medical conversations; tokenized once per
+    # instance and concatenated in tensor space on the hot path
+    MED_PREFIX = "Summarize the following medical conversation, focusing on symptoms, diagnoses, and treatments: "
+    
     def __init__(self, model_name="facebook/bart-large-cnn"):
         """
         Initialize the TextSummarizer with a specific model.
@@ -25,31 +164,41 @@ class TextSummarizer:
         self.model_name = model_name
         self.model = None
         self.tokenizer = None
+        self._med_prefix_ids = None
         
     def load_model(self):
         """
         Load the summarization model and tokenizer if not already loaded.
+        
+        Models come from the module-level cache, so every TextSummarizer
+        instance shares one loaded copy of each model's weights.
         """
         if self.model is None or self.tokenizer is None:
             logger.info(f"Loading summarization model and tokenizer: {self.model_name}")
             try:
-                self.model = AutoModelForSeq2SeqLM.from_pretrained(self.model_name)
-                self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                self.model, self.tokenizer = _get_model(self.model_name)
                 logger.info("Summarization model and tokenizer loaded successfully")
             except Exception as e:
                 logger.error(f"Error loading summarization model: {str(e)}")
                 raise
     
-    def summarize(self, text, max_length=1024, min_length=50, length_penalty=2.0, num_beams=4):
+    def summarize(self, text, max_new_tokens=256, min_length=50, length_penalty=2.0, num_beams=1,
+                  no_repeat_ngram_size=0):
         """
         Summarize the given text.
         
         Args:
             text (str): The text to summarize
-            max_length (int): Maximum length of the summary
+            max_new_tokens (int): Maximum number of generated summary
+                tokens. This bounds the decoder's KV-cache allocation, so
+                keep it as tight as the use case allows.
             min_length (int): Minimum length of the summary
             length_penalty (float): Length penalty for generation
-            num_beams (int): Number of beams for beam search
+            num_beams (int): Number of beams for beam search. Defaults to
+                greedy decoding (1); each extra beam multiplies decoder
+                compute and KV-cache memory per step.
+            no_repeat_ngram_size (int): Block repeating n-grams of this
+                size during generation (0 disables)
             
         Returns:
             str: Summarized text
@@ -60,30 +209,233 @@ class TextSummarizer:
             
             logger.info("Summarizing text")
             
-            # Truncate text if it's too long for the model
-            truncated_text = text[:50000]  # Arbitrary limit to prevent tokenizer errors
+            # Tokenize the full text once; transcripts that exceed the
+            # encoder window are summarized window-by-window in one batch
+            # instead of silently dropping everything past 1024 tokens.
+            # Truncation is decided in token space — no character-count
+            # guess-work ahead of the tokenizer
+            inputs = self.tokenizer(text, return_tensors="pt", truncation=False)
+            if inputs["input_ids"].shape[1] > self.MAX_INPUT_TOKENS:
+                return self._summarize_windows(
+                    inputs["input_ids"][0], max_new_tokens, min_length,
+                    length_penalty, num_beams, no_repeat_ngram_size
+                )
             
-            # Tokenize and generate summary
-            inputs = self.tokenizer(truncated_text, return_tensors="pt", max_length=1024, truncation=True)
+            summary = self._generate(
+                inputs["input_ids"], max_new_tokens, min_length,
+                length_penalty, num_beams, no_repeat_ngram_size
+            )
+            
+            logger.info("Summarization complete")
+            return summary
+        except Exception as e:
+            logger.error(f"Error during summarization: {str(e)}")
+            raise
+    
+    def _generate(self, input_ids, max_new_tokens, min_length, length_penalty,
+                  num_beams, no_repeat_ngram_size):
+        """
+        Run generation for already-tokenized input and decode the summary.
+        
+        Args:
+            input_ids (torch.Tensor): [1, seq] token ids
+            max_new_tokens (int): Maximum number of generated tokens
+            min_length (int): Minimum length of the summary
+            length_penalty (float): Length penalty for generation
+            num_beams (int): Number of beams for beam search
+            no_repeat_ngram_size (int): n-gram repetition block size
             
-            # Generate summary
+        Returns:
+            str: Summarized text
+        """
+        import torch
+        
+        # Keep inputs on the same device as the model
+        device = getattr(self.model, "device", None)
+        if device is not None and getattr(device, "type", "") == "cuda":
+            input_ids = input_ids.to(device)
+        
+        # Generate summary without autograd tracking
+        with torch.inference_mode():
+            # max_new_tokens (rather than max_length) sizes the decoder
+            # KV cache to the summary budget; the explicit pad_token_id
+            # avoids the fallback warning path in generate
             summary_ids = self.model.generate(
-                inputs["input_ids"],
-                max_length=max_length,
+                input_ids,
+                max_new_tokens=max_new_tokens,
                 min_length=min_length,
                 length_penalty=length_penalty,
                 num_beams=num_beams,
-                early_stopping=True
+                no_repeat_ngram_size=no_repeat_ngram_size,
+                do_sample=False,
+                use_cache=True,
+                pad_token_id=self.tokenizer.pad_token_id,
+                early_stopping=num_beams > 1
             )
+        
+        return self.tokenizer.decode(summary_ids[0], skip_special_tokens=True)
+    
+    def _summarize_windows(self, input_ids, max_new_tokens, min_length, length_penalty,
+                           num_beams, no_repeat_ngram_size):
+        """
+        Summarize a long token sequence by sliding overlapping encoder
+        windows over it, generating for all windows in one batched call,
+        and re-summarizing the joined window summaries to the requested
+        length. One batched generate amortizes dispatch overhead across
+        windows instead of paying it per chunk.
+        
+        Args:
+            input_ids (torch.Tensor): Token ids of the full text
+            max_new_tokens (int): Maximum number of generated tokens in
+                the final summary
+            min_length (int): Minimum length of the final summary
+            length_penalty (float): Length penalty for generation
+            num_beams (int): Number of beams for the final pass
+            no_repeat_ngram_size (int): n-gram repetition block size
             
-            # Decode summary
-            summary = self.tokenizer.decode(summary_ids[0], skip_special_tokens=True)
+        Returns:
+            str: Summarized text
+        """
+        import torch
+        
+        window = self.MAX_INPUT_TOKENS
+        windows = [input_ids[start:start + window]
+                   for start in range(0, len(input_ids), self.WINDOW_STRIDE)]
+        # Drop a trailing window that is pure overlap of the previous one
+        if len(windows) > 1 and len(windows[-1]) <= window - self.WINDOW_STRIDE:
+            windows.pop()
+        logger.info(f"Summarizing {len(input_ids)} tokens in {len(windows)} windows")
+        
+        pad_id = self.tokenizer.pad_token_id
+        batch = torch.full((len(windows), window), pad_id, dtype=input_ids.dtype)
+        attention_mask = torch.zeros((len(windows), window), dtype=torch.long)
+        for row, ids in enumerate(windows):
+            batch[row, :len(ids)] = ids
+            attention_mask[row, :len(ids)] = 1
+        
+        device = getattr(self.model, "device", None)
+        if device is not None and getattr(device, "type", "") == "cuda":
+            batch = batch.to(device)
+            attention_mask = attention_mask.to(device)
+        
+        with torch.inference_mode():
+            summary_ids = self.model.generate(
+                batch,
+                attention_mask=attention_mask,
+                max_new_tokens=150,
+                min_length=30,
+                num_beams=1,
+                no_repeat_ngram_size=no_repeat_ngram_size,
+                do_sample=False,
+                use_cache=True,
+                pad_token_id=self.tokenizer.pad_token_id
+            )
+        parts = self.tokenizer.batch_decode(summary_ids, skip_special_tokens=True)
+        combined = " ".join(parts)
+        
+        # Condense the per-window summaries into the final summary; the
+        # combined text shrinks enough per pass that this terminates
+        return self.summarize(
+            combined, max_new_tokens, min_length, length_penalty,
+            num_beams, no_repeat_ngram_size
+        )
+    
+    def summarize_batch(self, texts, max_new_tokens=256, min_length=30, length_penalty=2.0,
+                        num_beams=1, no_repeat_ngram_size=0):
+        """
+        Summarize several texts in one padded generate call. The batch
+        shares a single forward pass per decode step, so encoder and
+        decoder GEMMs amortize dispatch overhead across texts — far
+        cheaper than calling summarize per text. Texts that exceed the
+        encoder window are routed through the windowed summarize path
+        instead of being truncated, so nothing is silently discarded.
+        
+        Args:
+            texts (list): The texts to summarize
+            max_new_tokens (int): Maximum number of generated tokens per summary
+            min_length (int): Minimum length of each summary
+            length_penalty (float): Length penalty for generation
+            num_beams (int): Number of beams for beam search
+            no_repeat_ngram_size (int): n-gram repetition block size
             
-            logger.info("Summarization complete")
-            return summary
-        except Exception as e:
-            logger.error(f"Error during summarization: {str(e)}")
-            raise
+        Returns:
+            list: One summary per input text
+        """
+        if not texts:
+            return []
+        
+        import torch
+        
+        self.load_model()
+        
+        # Tokenize once without padding to get real lengths; over-window
+        # texts fall back to the windowed single-text path rather than
+        # losing everything past the encoder window to truncation
+        lengths = [len(ids) for ids in self.tokenizer(list(texts)).input_ids]
+        results = [None] * len(texts)
+        batched = [i for i, n in enumerate(lengths) if n <= self.MAX_INPUT_TOKENS]
+        for i, n in enumerate(lengths):
+            if n > self.MAX_INPUT_TOKENS:
+                results[i] = self.summarize(
+                    texts[i], max_new_tokens, min_length, length_penalty,
+                    num_beams, no_repeat_ngram_size
+                )
+        
+        if batched:
+            logger.info(f"Summarizing batch of {len(batched)} texts")
+            
+            # Pad to the longest text and hand generate the attention mask
+            # so pad positions are ignored. BART is an encoder-decoder, so
+            # right-padding with a mask is the correct layout (left-padding
+            # only matters for decoder-only models that continue the input).
+            inputs = self.tokenizer(
+                [texts[i] for i in batched], return_tensors="pt", padding=True
+            )
+            
+            device = getattr(self.model, "device", None)
+            if device is not None and getattr(device, "type", "") == "cuda":
+                inputs = {k: v.to(device) for k, v in inputs.items()}
+            
+            with torch.inference_mode():
+                summary_ids = self.model.generate(
+                    inputs["input_ids"],
+                    attention_mask=inputs["attention_mask"],
+                    max_new_tokens=max_new_tokens,
+                    min_length=min_length,
+                    length_penalty=length_penalty,
+                    num_beams=num_beams,
+                    no_repeat_ngram_size=no_repeat_ngram_size,
+                    do_sample=False,
+                    use_cache=True,
+                    pad_token_id=self.tokenizer.pad_token_id
+                )
+            
+            decoded = self.tokenizer.batch_decode(summary_ids, skip_special_tokens=True)
+            for i, summary in zip(batched, decoded):
+                results[i] = summary
+        
+        return results
+    
+    def summarize_medical_conversation_batch(self, texts):
+        """
+        Summarize several medical conversations in one batched generate.
+        
+        Args:
+            texts (list): The medical conversation texts to summarize
+            
+        Returns:
+            list: One summary per conversation
+        """
+        # Same parameters as summarize_medical_conversation, so the same
+        # text summarized via the batch or the single path agrees
+        return self.summarize_batch(
+            [self.MED_PREFIX + text for text in texts],
+            max_new_tokens=200,
+            min_length=30,
+            length_penalty=1.5,
+            num_beams=1,
+            no_repeat_ngram_size=3
+        )
     
     def summarize_medical_conversation(self, text):
         """
@@ -95,19 +447,48 @@ class TextSummarizer:
         Returns:
             str: Summarized medical conversation
         """
-        # Add a prefix to guide the model to focus on medical aspects
-        prefix = "Summarize the following medical conversation, focusing on symptoms, diagnoses, and treatments: "
+        import torch
         
-        # Combine prefix and text
-        prefixed_text = prefix + text
+        self.load_model()
         
-        # Generate summary with medical focus
-        return self.summarize(
-            prefixed_text,
-            max_length=200,  # Shorter summary for medical conversations
+        # The guiding prefix is constant, so its token ids are computed
+        # once and prepended in tensor space — only the conversation body
+        # goes through the tokenizer per call
+        if self._med_prefix_ids is None:
+            self._med_prefix_ids = self.tokenizer(
+                self.MED_PREFIX, add_special_tokens=False, return_tensors="pt"
+            ).input_ids
+        
+        body_ids = self.tokenizer(
+            text, add_special_tokens=False, return_tensors="pt"
+        ).input_ids
+        bos = torch.tensor([[self.tokenizer.bos_token_id]], dtype=body_ids.dtype)
+        eos = torch.tensor([[self.tokenizer.eos_token_id]], dtype=body_ids.dtype)
+        input_ids = torch.cat([bos, self._med_prefix_ids, body_ids, eos], dim=1)
+        
+        # Long conversations take the windowed string path instead
+        if input_ids.shape[1] > self.MAX_INPUT_TOKENS:
+            return self.summarize(
+                self.MED_PREFIX + text,
+                max_new_tokens=200,
+                min_length=30,
+                length_penalty=1.5,
+                num_beams=1,
+                no_repeat_ngram_size=3
+            )
+        
+        # Greedy decoding: beam search multiplies decoder compute and
+        # KV-cache traffic by the beam count, which dominates latency for
+        # these short summaries; no_repeat_ngram_size compensates for the
+        # lost beam diversity
+        logger.info("Summarizing medical conversation")
+        return self._generate(
+            input_ids,
+            max_new_tokens=200,  # Shorter summary for medical conversations
             min_length=30,
             length_penalty=1.5,  # Less penalty for length
-            num_beams=4
+            num_beams=1,
+            no_repeat_ngram_size=3
         )
 
 # Example usage
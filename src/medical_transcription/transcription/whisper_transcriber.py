@@ -1,80 +1,379 @@
+import hashlib
 import os
-import librosa
-import numpy as np
-import whisper
 import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from ..logging_config import configure
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure()
 logger = logging.getLogger(__name__)
 
+# Shared pool for overlapping model load with audio decode; both release
+# the GIL in native code, so they genuinely run concurrently
+_EXECUTOR = ThreadPoolExecutor(max_workers=2)
+
+@lru_cache(maxsize=4)
+def _load_faster_whisper(model_size, compute_type):
+    """
+    Load a faster-whisper model once per (size, compute type) and share it
+    across all WhisperTranscriber instances. Runs on GPU when CUDA is
+    available, promoting a plain int8 compute type to int8_float16 so
+    activations use tensor-core fp16 while weights stay quantized.
+    """
+    from faster_whisper import WhisperModel
+    device = "cpu"
+    try:
+        import torch
+        if torch.cuda.is_available():
+            device = "cuda"
+            if compute_type == "int8":
+                compute_type = "int8_float16"
+    except ImportError:
+        pass
+    return WhisperModel(
+        model_size,
+        device=device,
+        compute_type=compute_type,
+        cpu_threads=os.cpu_count(),
+        num_workers=2
+    )
+
+@lru_cache(maxsize=4)
+def _load_reference_whisper(model_size):
+    """
+    Load an openai-whisper model once per size and share it across all
+    WhisperTranscriber instances. On CUDA the weights are halved to fp16,
+    which doubles effective bandwidth and tensor-core throughput and
+    halves GPU memory.
+    """
+    import whisper
+    model = whisper.load_model(model_size)
+    try:
+        import torch
+        if torch.cuda.is_available():
+            model = model.half().cuda()
+            logger.info("Whisper model weights halved to fp16 on GPU")
+    except Exception as e:
+        logger.warning(f"Could not move Whisper model to fp16: {str(e)}")
+    return model
+
 class WhisperTranscriber:
     """
-    A class to handle audio transcription using OpenAI's Whisper model.
+    A class to handle audio transcription using Whisper models.
+
+    Uses the faster-whisper (CTranslate2) backend with int8 quantization by
+    default, which is significantly faster than the reference openai-whisper
+    implementation on CPU. Falls back to openai-whisper if faster-whisper is
+    not installed.
     """
-    
-    def __init__(self, model_size="base"):
+
+    def __init__(self, model_size="base", compute_type=None, precision=None):
         """
         Initialize the WhisperTranscriber with a specific model size.
-        
+
         Args:
-            model_size (str): Size of the Whisper model to use. 
+            model_size (str): Size of the Whisper model to use.
                              Options: "tiny", "base", "small", "medium", "large"
+            compute_type (str, optional): CTranslate2 compute type, e.g. "int8"
+                             (CPU default) or "int8_float16" for GPU deployments.
+                             Can also be set via the WHISPER_COMPUTE_TYPE
+                             environment variable.
+            precision (str, optional): Autocast precision for the
+                             openai-whisper backend on GPU: "bf16", "fp16" or
+                             "fp32". Defaults to WHISPER_PRECISION or "bf16".
         """
         logger.info(f"Initializing WhisperTranscriber with model size: {model_size}")
         self.model = None
         self.model_size = model_size
-        
+        self.compute_type = compute_type or os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+        self.precision = precision or os.getenv("WHISPER_PRECISION", "bf16")
+        self.backend = None  # "faster-whisper" or "openai-whisper"
+
     def load_model(self):
         """
         Load the Whisper model if not already loaded.
+
+        Prefers the faster-whisper (CTranslate2) backend; falls back to the
+        reference openai-whisper implementation if it is unavailable.
         """
         if self.model is None:
             logger.info(f"Loading Whisper model: {self.model_size}")
             try:
-                self.model = whisper.load_model(self.model_size)
-                logger.info("Whisper model loaded successfully")
+                self.model = _load_faster_whisper(self.model_size, self.compute_type)
+                self.backend = "faster-whisper"
+                logger.info(f"faster-whisper model loaded successfully (compute_type={self.compute_type})")
+            except ImportError:
+                logger.warning("faster-whisper not installed, falling back to openai-whisper")
+                try:
+                    self.model = _load_reference_whisper(self.model_size)
+                    self.backend = "openai-whisper"
+                    logger.info("Whisper model loaded successfully")
+                    self._compile_decoder()
+                    self._prime_mel_filters()
+                except Exception as e:
+                    logger.error(f"Error loading Whisper model: {str(e)}")
+                    raise
             except Exception as e:
-                logger.error(f"Error loading Whisper model: {str(e)}")
+                logger.error(f"Error loading faster-whisper model: {str(e)}")
                 raise
-    
+
+    def _compile_decoder(self):
+        """
+        Compile the eager-mode Whisper decoder with torch.compile so the
+        autoregressive loop is specialized to fixed shapes instead of issuing
+        one kernel per layer per step. Only applies to the openai-whisper
+        backend — CTranslate2 already ships fused, specialized kernels. Can
+        be disabled via WHISPER_COMPILE=false.
+        """
+        if os.getenv("WHISPER_COMPILE", "true").lower() != "true":
+            return
+        # The model object is shared between instances via the module cache;
+        # only compile it once
+        if getattr(self.model, "_decoder_compiled", False):
+            return
+        try:
+            import torch
+            self.model._decoder_compiled = True
+            self.model.decoder = torch.compile(
+                self.model.decoder, mode="reduce-overhead", dynamic=False
+            )
+            logger.info("Compiled Whisper decoder with torch.compile (mode=reduce-overhead)")
+        except Exception as e:
+            logger.warning(f"torch.compile unavailable for Whisper decoder, using eager mode: {str(e)}")
+
+    def _prime_mel_filters(self):
+        """
+        Serialize the mel filterbank to a .npy file once and keep it resident
+        as a tensor, so every spectrogram computation reuses the same weights
+        instead of re-reading them from the whisper package assets per call.
+        Only meaningful for the openai-whisper backend; CTranslate2 manages
+        its own feature extraction.
+        """
+        try:
+            import numpy as np
+            import torch
+            import whisper.audio as whisper_audio
+
+            # Already patched by an earlier instance sharing the cache
+            if getattr(whisper_audio.mel_filters, "_cached", False):
+                return
+
+            n_mels = 80
+            cache_dir = os.path.join(
+                os.path.expanduser("~"), ".cache", "medical_transcription"
+            )
+            os.makedirs(cache_dir, exist_ok=True)
+            cache_path = os.path.join(cache_dir, f"mel_filters_{n_mels}.npy")
+
+            original_mel_filters = whisper_audio.mel_filters
+            if not os.path.exists(cache_path):
+                filters = original_mel_filters("cpu", n_mels)
+                np.save(cache_path, filters.numpy())
+                logger.info(f"Serialized mel filterbank to {cache_path}")
+
+            # Memory-map the weights and keep one resident tensor per device
+            resident = torch.from_numpy(np.array(np.load(cache_path, mmap_mode="r")))
+            device_cache = {}
+
+            def cached_mel_filters(device, requested_n_mels):
+                if requested_n_mels == n_mels:
+                    device_key = str(device)
+                    if device_key not in device_cache:
+                        device_cache[device_key] = resident.to(device)
+                    return device_cache[device_key]
+                return original_mel_filters(device, requested_n_mels)
+
+            cached_mel_filters._cached = True
+            whisper_audio.mel_filters = cached_mel_filters
+            logger.info("Mel filterbank weights cached and memory-mapped")
+        except Exception as e:
+            logger.warning(f"Could not cache mel filterbank weights: {str(e)}")
+
+    # Whisper's native receptive field; the reference backend is fed one
+    # such chunk at a time instead of the whole recording
+    CHUNK_SECONDS = 30
+    SAMPLE_RATE = 16000
+
+    # Size bound on the decoded-audio cache; a 42-minute recording is
+    # ~80 MB of int16 samples, so 1 GB holds roughly a dozen recordings
+    AUDIO_CACHE_MAX_BYTES = 1 << 30
+
+    def _transcribe_reference(self, audio):
+        """
+        Run the openai-whisper backend, feeding the audio in 30-second
+        chunks so its internal buffers stay bounded by one chunk rather
+        than the whole recording. faster-whisper segments internally, so
+        this only applies to the fallback backend. Runs under
+        reduced-precision autocast on GPU — bf16/fp16 halves memory
+        bandwidth in the encoder matmuls and engages tensor cores; on CPU
+        (or with precision="fp32") the model runs as before.
+        """
+        chunk_samples = self.CHUNK_SECONDS * self.SAMPLE_RATE
+        if len(audio) <= chunk_samples:
+            return self._run_reference(audio)
+
+        starts = range(0, len(audio), chunk_samples)
+        logger.info(f"Transcribing {len(starts)} chunks of {self.CHUNK_SECONDS}s")
+        texts = []
+        tail = ""
+        for start in starts:
+            # Condition each chunk on the tail of the previous transcript,
+            # standing in for the prompt carry-over whisper's internal
+            # window sliding would provide — words spanning a boundary
+            # decode with their left context instead of cold
+            result = self._run_reference(
+                audio[start:start + chunk_samples],
+                initial_prompt=tail or None
+            )
+            texts.append(result["text"])
+            tail = result["text"][-200:]
+        return {"text": "".join(texts)}
+
+    def _run_reference(self, audio, **kwargs):
+        """Invoke the reference model on one chunk with the right autocast."""
+        import torch
+        if torch.cuda.is_available() and self.precision in ("bf16", "fp16"):
+            dtype = torch.bfloat16 if self.precision == "bf16" else torch.float16
+            with torch.inference_mode(), torch.autocast(device_type="cuda", dtype=dtype):
+                # fp16=True keeps transcribe from casting the halved
+                # weights back to fp32 internally
+                return self.model.transcribe(audio, fp16=True, **kwargs)
+        with torch.inference_mode():
+            return self.model.transcribe(audio, **kwargs)
+
+    def _decode_audio(self, audio_file):
+        """
+        Decode with a native ffmpeg path — it decodes and resamples to
+        16 kHz in native code, unlike librosa's Python-level resampler
+        which processed the whole file on the request thread before
+        transcription could start. Both decoders produce the same float32
+        mono buffer, so the choice is by availability rather than by
+        which model backend ends up loaded.
+        """
+        try:
+            from faster_whisper.audio import decode_audio
+            return decode_audio(audio_file, sampling_rate=self.SAMPLE_RATE)
+        except ImportError:
+            import whisper
+            return whisper.load_audio(audio_file)
+
+    def _load_audio_cached(self, audio_file):
+        """
+        Decode an audio file, caching the 16 kHz mono result as raw int16
+        next to the app's cache dir. Re-transcribing the same file (retries,
+        re-runs) then memory-maps the cached buffer instead of paying the
+        multi-second ffmpeg decode again. The key covers path and mtime, so
+        a modified file is re-decoded.
+
+        API uploads land in uniquely-named temporary files, so a path-keyed
+        entry for them can never be hit again — those are decoded directly,
+        skipping the cache write entirely.
+        """
+        import numpy as np
+
+        # Files under the temp dir are one-shot uploads; caching them only
+        # costs write latency and disk
+        tmp_root = tempfile.gettempdir()
+        if os.path.abspath(audio_file).startswith(tmp_root + os.sep):
+            return self._decode_audio(audio_file)
+
+        cache_dir = os.path.join(
+            os.path.expanduser("~"), ".cache", "medical_transcription", "audio"
+        )
+        cache_path = None
+        try:
+            key = hashlib.sha1(
+                f"{os.path.abspath(audio_file)}:{os.path.getmtime(audio_file)}".encode()
+            ).hexdigest()
+            cache_path = os.path.join(cache_dir, f"{key}.int16")
+            if os.path.exists(cache_path):
+                logger.info("Using cached decoded audio")
+                return np.memmap(cache_path, dtype=np.int16, mode="r").astype(np.float32) / 32768.0
+        except OSError as cache_error:
+            logger.warning(f"Audio cache unavailable: {str(cache_error)}")
+
+        audio = self._decode_audio(audio_file)
+
+        if cache_path is not None:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                (np.clip(audio, -1.0, 1.0) * 32767.0).astype(np.int16).tofile(cache_path)
+                logger.info(f"Cached decoded audio at {cache_path}")
+                self._evict_audio_cache(cache_dir)
+            except Exception as cache_error:
+                logger.warning(f"Could not cache decoded audio: {str(cache_error)}")
+
+        return audio
+
+    def _evict_audio_cache(self, cache_dir):
+        """
+        Drop the oldest cached decode results until the cache fits
+        AUDIO_CACHE_MAX_BYTES, so repeat transcriptions stay cheap without
+        the cache directory growing without bound.
+        """
+        try:
+            entries = []
+            total = 0
+            for name in os.listdir(cache_dir):
+                path = os.path.join(cache_dir, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.AUDIO_CACHE_MAX_BYTES:
+                    break
+                os.remove(path)
+                total -= size
+                logger.info(f"Evicted cached decoded audio: {path}")
+        except OSError as evict_error:
+            logger.warning(f"Audio cache eviction failed: {str(evict_error)}")
+
     def transcribe(self, audio_file, duration=2520):
         """
         Transcribe audio using Whisper model locally, without internet connection.
         Only processes the first 'duration' seconds.
-        
+
         Args:
             audio_file (str): Path to the audio file
             duration (int): Duration in seconds to process (default: 2520 seconds = 42 minutes)
-            
+
         Returns:
             str: Transcribed text
         """
         try:
             logger.info(f"Loading audio file: {audio_file}")
-            
+
             # Check if file exists
             if not os.path.exists(audio_file):
                 logger.error(f"Audio file not found: {audio_file}")
                 raise FileNotFoundError(f"Audio file not found: {audio_file}")
-            
-            # Load only the specified duration
-            audio, sr = librosa.load(audio_file, sr=16000, duration=duration)
-            
-            duration_minutes = len(audio) / sr / 60
+
+            # Decode audio and load the model concurrently — the
+            # multi-second ffmpeg decode hides most of a cold model load
+            model_future = _EXECUTOR.submit(self.load_model)
+            audio = self._load_audio_cached(audio_file)
+            model_future.result()
+
+            # Keep only the specified duration
+            audio = audio[:duration * self.SAMPLE_RATE]
+
+            duration_minutes = len(audio) / self.SAMPLE_RATE / 60
             logger.info(f"Loaded {duration_minutes:.2f} minutes of audio")
-            
-            # Load Whisper model if not already loaded
-            self.load_model()
-            
-            logger.info("Starting transcription with Whisper...")
-            result = self.model.transcribe(audio)
+
+            logger.info(f"Starting transcription with {self.backend}...")
+            if self.backend == "faster-whisper":
+                segments, _ = self.model.transcribe(audio, beam_size=1, vad_filter=True)
+                text = "".join(segment.text for segment in segments)
+            else:
+                result = self._transcribe_reference(audio)
+                text = result["text"]
             logger.info("Transcription complete")
-            
-            return result["text"]
+
+            return text
         except Exception as e:
             logger.error(f"Error during transcription: {str(e)}")
             raise
@@ -87,4 +386,4 @@ if __name__ == "__main__":
         transcription = transcriber.transcribe(audio_path)
         print(transcription)
     else:
-        print(f"Audio file not found: {audio_path}") 
\ No newline at end of file
+        print(f"Audio file not found: {audio_path}")
@@ -0,0 +1,46 @@
+"""
+Background worker actors for CPU-heavy post-processing.
+
+FastAPI's BackgroundTasks run inside the same uvicorn worker process, so
+embedding text for the knowledge base or rendering a PDF still steals CPU
+from request handling. When Dramatiq and Redis are available these jobs are
+sent to a dedicated worker pool instead (run with
+``dramatiq medical_transcription.workers``); otherwise callers fall back to
+in-process execution.
+"""
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+try:
+    import dramatiq
+    from dramatiq.brokers.redis import RedisBroker
+
+    _broker = RedisBroker(url=os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    # RedisBroker construction never contacts the server, so a dramatiq
+    # install without a running Redis would otherwise look available here
+    # and then fail on every .send() at request time
+    _broker.client.ping()
+    dramatiq.set_broker(_broker)
+    WORKERS_AVAILABLE = True
+    logger.info("Dramatiq worker queue configured")
+except Exception as e:
+    dramatiq = None
+    WORKERS_AVAILABLE = False
+    logger.info(f"Dramatiq worker queue not available, jobs will run in-process: {e}")
+
+
+if WORKERS_AVAILABLE:
+    from . import models
+
+    @dramatiq.actor(max_retries=3)
+    def build_kb(text):
+        """Build the FAISS knowledge base index for a transcription."""
+        models.get_knowledge_base().create_index(text)
+
+    @dramatiq.actor(max_retries=3)
+    def render_pdf(report_text, path):
+        """Render a generated report to a PDF file."""
+        models.get_report_generator().save_report_as_pdf(report_text, path)
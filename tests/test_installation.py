@@ -4,8 +4,9 @@ Test script to verify that all dependencies are installed correctly.
 """
 
 import sys
-import importlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from importlib import metadata
 
 # Configure logging
 logging.basicConfig(
@@ -15,42 +16,42 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-def check_dependency(module_name, min_version=None):
+def check_dependency(package_name, min_version=None):
     """
     Check if a dependency is installed and meets the minimum version requirement.
     
+    Reads the installed distribution's metadata instead of importing the
+    package, so checking torch or transformers takes microseconds rather
+    than pulling hundreds of MB of sub-imports (and CUDA init) into the
+    process just to read a version string.
+    
     Args:
-        module_name (str): Name of the module to check
+        package_name (str): Distribution name of the package to check
+            (e.g. "faiss-cpu", not "faiss")
         min_version (str, optional): Minimum version required
         
     Returns:
         bool: True if the dependency is installed and meets the version requirement
     """
     try:
-        module = importlib.import_module(module_name)
-        if hasattr(module, '__version__'):
-            version = module.__version__
-        elif hasattr(module, 'VERSION'):
-            version = module.VERSION
-        elif hasattr(module, 'version'):
-            version = module.version
-        else:
-            version = "Unknown"
-            
-        if min_version and version != "Unknown":
-            from packaging import version as packaging_version
-            if packaging_version.parse(version) < packaging_version.parse(min_version):
-                logger.warning(f"{module_name} version {version} is installed, but version {min_version} or higher is required")
-                return False
-                
-        logger.info(f"✅ {module_name} (version {version}) is installed")
-        return True
-    except ImportError:
-        logger.error(f"❌ {module_name} is not installed")
+        version = metadata.version(package_name)
+    except metadata.PackageNotFoundError:
+        logger.error(f"❌ {package_name} is not installed")
         return False
+    
+    if min_version:
+        from packaging import version as packaging_version
+        if packaging_version.parse(version) < packaging_version.parse(min_version):
+            logger.warning(f"{package_name} version {version} is installed, but version {min_version} or higher is required")
+            return False
+    
+    logger.info(f"✅ {package_name} (version {version}) is installed")
+    return True
 
 def main():
     """Run the dependency checks."""
+    # Distribution names as they appear in requirements.txt, which is what
+    # metadata.version expects
     dependencies = [
         # Core dependencies
         ("fastapi", "0.104.0"),
@@ -58,31 +59,32 @@ def main():
         ("pydantic", "2.4.0"),
         
         # Audio processing
-        ("librosa", "0.10.0"),
         ("numpy", "1.24.0"),
-        ("whisper", "1.0.0"),
+        ("openai-whisper", None),
+        ("faster-whisper", "0.10.0"),
         
         # NLP and AI
         ("transformers", "4.34.0"),
         ("torch", "2.0.0"),
         ("langchain", "0.0.300"),
-        ("faiss", None),  # faiss-cpu package
-        ("sentence_transformers", "2.2.0"),
-        ("google.generativeai", "0.3.0"),
+        ("faiss-cpu", None),
+        ("sentence-transformers", "2.2.0"),
+        ("google-generativeai", "0.3.0"),
         
         # Document generation
         ("reportlab", "4.0.0"),
-        ("dotenv", None),  # python-dotenv package
+        ("python-dotenv", None),
         
         # Utilities
         ("requests", "2.31.0"),
         ("tqdm", "4.66.0"),
     ]
     
-    all_passed = True
-    for module_name, min_version in dependencies:
-        if not check_dependency(module_name, min_version):
-            all_passed = False
+    # The checks are independent filesystem scans of dist-info, so run
+    # them concurrently
+    with ThreadPoolExecutor(max_workers=min(16, len(dependencies))) as executor:
+        results = list(executor.map(lambda dep: check_dependency(*dep), dependencies))
+    all_passed = all(results)
     
     if all_passed:
         logger.info("All dependencies are installed correctly! 🎉")